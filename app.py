@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import heapq
 from supabase import create_client, Client
 import time
 from functools import wraps
@@ -26,23 +27,31 @@ def retry_on_error(max_retries=3, delay=1):
         return wrapper
     return decorator
 
+# 进程内所有会话共用一个客户端，每5分钟重建一次
+@st.cache_resource(ttl=300, show_spinner=False)
+def _create_supabase_client() -> Client:
+    url = st.secrets["SUPABASE_URL"].strip()
+    key = st.secrets["SUPABASE_KEY"].strip()
+    return create_client(url, key)
+
 class SupabaseManager:
-    _client = None
-    _last_used = None
-    
     @classmethod
     def get_client(cls):
-        now = datetime.now().timestamp()
-        if cls._client is None or (cls._last_used and now - cls._last_used > 300):
-            url = st.secrets["SUPABASE_URL"].strip()
-            key = st.secrets["SUPABASE_KEY"].strip()
-            cls._client = create_client(url, key)
-            cls._last_used = now
-        return cls._client
+        return _create_supabase_client()
     
     @classmethod
     def reset(cls):
-        cls._client = None
+        _create_supabase_client.clear()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_site_data(site: str):
+    client = SupabaseManager.get_client()
+    # 一次 RPC 取回站点的订单（按时间倒序）、订单明细和手动确认价，见 schema.sql
+    bundle = client.rpc('get_site_bundle', {'p_site': site}).execute().data or {}
+    orders = bundle.get('orders') or []
+    items = bundle.get('items') or []
+    manual = bundle.get('manual') or []
+    return orders, items, {m['sku']: m['manual_price'] for m in manual}
 
 class SymbolicSolver:
     def __init__(self):
@@ -56,30 +65,24 @@ class SymbolicSolver:
     
     @retry_on_error(max_retries=3, delay=2)
     def add_order(self, site: str, order_id: str, total: float, items: list):
-        existing = self.client.table('orders').select("*").eq('site', site).eq('order_id', order_id).execute()
-        if existing.data:
-            return False, "订单号已存在"
+        # SKU 已在录入时统一为去空格大写，这里不再重复处理
+        batch = [{"sku": item['sku'], "quantity": int(item['qty'])} for item in items if item['sku']]
         
-        self.client.table('orders').insert({
-            "site": site, "order_id": order_id,
-            "total_hidden_price": total,
-            "created_at": datetime.now().isoformat()
-        }).execute()
-        
-        batch = [{
-            "site": site, "order_id": order_id,
-            "sku": item['sku'].upper().strip(),
-            "quantity": int(item['qty'])
-        } for item in items if item['sku']]
-        
-        if batch:
-            self.client.table('order_items').insert(batch).execute()
+        # 订单和明细在一个事务里写入，订单号重复由 ON CONFLICT 判断，一次请求完成，见 schema.sql
+        inserted = self.client.rpc('add_site_order', {
+            'p_site': site, 'p_order_id': order_id, 'p_total': total,
+            'p_items': batch, 'p_created_at': datetime.now().isoformat()
+        }).execute().data
+        if not inserted:
+            return False, "订单号已存在"
+        _fetch_site_data.clear(site)
         return True, "保存成功"
     
     @retry_on_error(max_retries=3, delay=2)
     def delete_order(self, site: str, order_id: str):
-        self.client.table('order_items').delete().eq('site', site).eq('order_id', order_id).execute()
-        self.client.table('orders').delete().eq('site', site).eq('order_id', order_id).execute()
+        # 明细和订单在一个事务里删除，见 schema.sql
+        self.client.rpc('delete_site_order', {'p_site': site, 'p_order_id': order_id}).execute()
+        _fetch_site_data.clear(site)
         return True
     
     @retry_on_error(max_retries=3, delay=2)
@@ -88,19 +91,19 @@ class SymbolicSolver:
             "site": site, "sku": sku, "manual_price": price,
             "confirmed_at": datetime.now().isoformat()
         }).execute()
+        _fetch_site_data.clear(site)
         return True
     
     @retry_on_error(max_retries=3, delay=2)
     def clear_manual_price(self, site: str, sku: str):
         self.client.table('manual_prices').delete().eq('site', site).eq('sku', sku).execute()
+        _fetch_site_data.clear(site)
         return True
     
     @retry_on_error(max_retries=3, delay=2)
     def get_site_data(self, site: str):
-        orders = self.client.table('orders').select("*").eq('site', site).execute().data or []
-        items = self.client.table('order_items').select("*").eq('site', site).execute().data or []
-        manual = self.client.table('manual_prices').select("*").eq('site', site).execute().data or []
-        return orders, items, {m['sku']: m['manual_price'] for m in manual}
+        # 读取走缓存，写操作后会主动清除
+        return _fetch_site_data(site)
 
 class SiteSolver:
     def __init__(self):
@@ -111,100 +114,136 @@ class SiteSolver:
         if not orders:
             return {}, {}, [], [], [], []
         
-        # 调用求解逻辑，确保返回6个值
-        result = self._solve_logic(orders, items, manual)
-        return result
+        # 只把求解需要的字段压成元组作为缓存键，数据未变时直接命中缓存
+        # 订单按时间倒序返回，求解时按录入先后处理，早录入的订单作为比对基准
+        order_rows = tuple((o['order_id'], float(o['total_hidden_price'])) for o in reversed(orders))
+        item_rows = tuple((it['order_id'], it['sku'], int(it['quantity'])) for it in items)
+        manual_rows = tuple(sorted(manual.items()))
+        
+        # 与上次求解的数据完全相同时直接复用结果，连 st.cache_data 的参数哈希也省掉
+        data_hash = hash((order_rows, item_rows, manual_rows))
+        last_solve = st.session_state.get('last_solve')
+        if last_solve is not None and last_solve[0] == data_hash:
+            result = last_solve[1]
+        else:
+            result = _solve_cached(order_rows, item_rows, manual_rows)
+            st.session_state.last_solve = (data_hash, result)
+        determined, conflicts, constraints, underdetermined, inconsistent_orders = result
+        # 统一返回格式：6个值
+        return determined, conflicts, constraints, underdetermined, orders, inconsistent_orders
     
-    def _solve_logic(self, orders, items, manual_prices):
-        order_map = {o['order_id']: {'total': o['total_hidden_price'], 'items': []} for o in orders}
-        for it in items:
-            if it['order_id'] in order_map:
-                order_map[it['order_id']]['items'].append(it)
+    @staticmethod
+    def _solve_logic(order_rows, item_rows, manual_prices):
+        order_map = {oid: {'total': total, 'items': []} for oid, total in order_rows}
+        for oid, sku, qty in item_rows:
+            if oid in order_map:
+                order_map[oid]['items'].append({'sku': sku, 'quantity': qty})
         
-        all_skus = list(set(it['sku'] for it in items))
+        all_skus = list(set(sku for _, sku, _ in item_rows))
         determined = dict(manual_prices)
         conflicts = {}
         inconsistent_orders = []
         manual_skus = set(manual_prices.keys())
         
-        changed = True
-        iteration = 0
-        while changed and iteration < 50:
-            changed = False
-            iteration += 1
+        # 商品组合相同的订单是同一个方程：总价一致的只保留一条；
+        # 多SKU订单总价不一致时无法归到某个SKU上，单独列出（单SKU的走下面的矛盾检测）
+        seen = {}
+        for oid in list(order_map):
+            data = order_map[oid]
+            counts = {}
+            for it in data['items']:
+                counts[it['sku']] = counts.get(it['sku'], 0) + it['quantity']
+            key = frozenset(counts.items())
+            if key not in seen:
+                seen[key] = oid
+                continue
+            first = order_map[seen[key]]
+            if abs(first['total'] - data['total']) <= 0.01:
+                del order_map[oid]
+            elif len(counts) > 1:
+                inconsistent_orders.append({
+                    'order_id': oid,
+                    'total': data['total'],
+                    'same_as': seen[key],
+                    'same_as_total': first['total'],
+                    'equation': " + ".join(f"{qty}×{sku}" for sku, qty in counts.items())
+                })
+                del order_map[oid]
+        
+        # 某个SKU被确定后，只需重新检查包含它的订单；
+        # 待检查订单按 (轮次, 订单位置) 出队，与逐轮全量扫描的推导顺序一致
+        order_ids = list(order_map)
+        sku_orders = {}
+        for pos, oid in enumerate(order_ids):
+            for it in order_map[oid]['items']:
+                sku_orders.setdefault(it['sku'], []).append(pos)
+        
+        pending = [(0, pos) for pos in range(len(order_ids))]
+        queued = set(range(len(order_ids)))
+        while pending:
+            sweep, pos = heapq.heappop(pending)
+            queued.discard(pos)
+            oid = order_ids[pos]
+            data = order_map[oid]
+            total = data['total']
+            o_items = data['items']
             
-            for oid, data in order_map.items():
-                total = data['total']
-                o_items = data['items']
-                
-                known_sum = 0
-                unknown_items = []
-                
-                for it in o_items:
-                    sku = it['sku']
-                    qty = it['quantity']
-                    if sku in determined:
-                        known_sum += qty * determined[sku]
-                    else:
-                        unknown_items.append((sku, qty))
-                
-                remaining = total - known_sum
-                
-                # ================== 核心修复开始 ==================
-                if len(unknown_items) == 0:
-                    if abs(remaining) > 0.01:
-                        # 修复：如果订单只有一个SKU，且与已确定值矛盾
-                        if len(o_items) == 1:
-                            sku = o_items[0]['sku']
-                            qty = o_items[0]['quantity']
-                            # 只处理非手动确认的SKU（手动确认的是"真理"，不应报矛盾）
-                            if sku not in manual_skus and qty > 0:
-                                implied_price = total / qty
-                                current_price = determined.get(sku, 0)
-                                # 检查是否与当前确定值显著不同
-                                if abs(current_price - implied_price) > 0.01:
-                                    if sku not in conflicts:
-                                        conflicts[sku] = []
-                                    conflict_info = {
-                                        'value': implied_price,
-                                        'derived_from': oid,
-                                        'equation': f"{qty}×{sku} = {total:.2f} (订单{oid})",
-                                        'current': current_price,
-                                        'type': 'order_mismatch'
-                                    }
-                                    # 避免重复添加相似的值
-                                    if not any(abs(c['value'] - implied_price) < 0.01 for c in conflicts[sku]):
-                                        conflicts[sku].append(conflict_info)
-                    continue
-                # ================== 核心修复结束 ==================
+            known_sum = 0
+            unknown_items = []
+            
+            for it in o_items:
+                sku = it['sku']
+                qty = it['quantity']
+                if sku in determined:
+                    known_sum += qty * determined[sku]
+                else:
+                    unknown_items.append((sku, qty))
+            
+            remaining = total - known_sum
+            
+            # ================== 核心修复开始 ==================
+            if len(unknown_items) == 0:
+                if abs(remaining) > 0.01:
+                    # 修复：如果订单只有一个SKU，且与已确定值矛盾
+                    if len(o_items) == 1:
+                        sku = o_items[0]['sku']
+                        qty = o_items[0]['quantity']
+                        # 只处理非手动确认的SKU（手动确认的是"真理"，不应报矛盾）
+                        if sku not in manual_skus and qty > 0:
+                            implied_price = total / qty
+                            current_price = determined.get(sku, 0)
+                            # 检查是否与当前确定值显著不同
+                            if abs(current_price - implied_price) > 0.01:
+                                if sku not in conflicts:
+                                    conflicts[sku] = []
+                                conflict_info = {
+                                    'value': implied_price,
+                                    'derived_from': oid,
+                                    'equation': f"{qty}×{sku} = {total:.2f} (订单{oid})",
+                                    'current': current_price,
+                                    'type': 'order_mismatch'
+                                }
+                                # 避免重复添加相似的值
+                                if not any(abs(c['value'] - implied_price) < 0.01 for c in conflicts[sku]):
+                                    conflicts[sku].append(conflict_info)
+                continue
+            # ================== 核心修复结束 ==================
+            
+            if len(unknown_items) == 1:
+                sku, qty = unknown_items[0]
+                if qty == 0:
+                    val = 0
+                else:
+                    val = remaining / qty
                 
-                if len(unknown_items) == 1:
-                    sku, qty = unknown_items[0]
-                    if qty == 0:
-                        val = 0
-                    else:
-                        val = remaining / qty
-                    
-                    if sku in determined:
-                        old_val = determined[sku]
-                        if sku in manual_skus:
-                            continue
-                        
-                        if abs(old_val - val) > 0.01:
-                            if sku not in conflicts:
-                                conflicts[sku] = []
-                            conflict_info = {
-                                'value': val,
-                                'derived_from': oid,
-                                'equation': f"{qty}×{sku} = {remaining:.2f} (基于订单{oid})",
-                                'current': old_val,
-                                'type': 'derivation_conflict'
-                            }
-                            if not any(abs(c['value'] - val) < 0.01 for c in conflicts[sku]):
-                                conflicts[sku].append(conflict_info)
-                    else:
-                        determined[sku] = val
-                        changed = True
+                determined[sku] = val
+                for other in sku_orders[sku]:
+                    if other not in queued:
+                        heapq.heappush(pending, (sweep if other > pos else sweep + 1, other))
+                        queued.add(other)
+        
+        # 逐个代入无法再推进时，对剩余的耦合方程组做线性求解
+        determined.update(SiteSolver._solve_residual(order_map, item_rows, determined))
         
         # 过滤掉手动确认的SKU的矛盾（不再显示）
         conflicts = {k: v for k, v in conflicts.items() if k not in manual_skus}
@@ -229,8 +268,103 @@ class SiteSolver:
                         'missing_skus': [sku for _, sku in unknown_terms]
                     })
         
-        # 统一返回格式：6个值，确保变量名正确
-        return determined, conflicts, constraints, list(underdetermined), orders, inconsistent_orders
+        return determined, conflicts, constraints, list(underdetermined), inconsistent_orders
+    
+    @staticmethod
+    def _solve_residual(order_map, item_rows, determined):
+        # 多数站点靠逐个代入就能全部确定，这时不必构造矩阵，也不必加载 scipy
+        if not any(
+            sum(it['sku'] not in determined for it in data['items']) >= 2
+            for data in order_map.values()
+        ):
+            return {}
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        
+        items_df = pd.DataFrame(list(item_rows), columns=['order_id', 'sku', 'quantity'])
+        row_idx = pd.Index(list(order_map)).get_indexer(items_df['order_id'])
+        items_df = items_df[row_idx >= 0]
+        row_idx = row_idx[row_idx >= 0]
+        if items_df.empty:
+            return {}
+        col_idx, skus = pd.factorize(items_df['sku'], sort=True)
+        
+        # 每个订单只涉及少数SKU，用稀疏矩阵存储（重复的(行,列)会被累加）
+        A_full = coo_matrix(
+            (items_df['quantity'].to_numpy(dtype=np.float64), (row_idx, col_idx)),
+            shape=(len(order_map), len(skus))
+        ).tocsr()
+        totals = np.array([data['total'] for data in order_map.values()], dtype=np.float64)
+        # 已确定价按列顺序一次取出，未确定的记为 NaN 再置0
+        known_values = np.fromiter(
+            (determined.get(sku, np.nan) for sku in skus.tolist()), dtype=np.float64, count=len(skus)
+        )
+        known = ~np.isnan(known_values)
+        known_values[~known] = 0.0
+        
+        # 已确定SKU的金额先从订单总价中扣除，只保留仍含≥2个未知SKU的订单
+        A_unknown = A_full[:, ~known]
+        residual_rows = A_unknown.getnnz(axis=1) >= 2
+        if not residual_rows.any():
+            return {}
+        A = A_unknown[residual_rows]
+        b = (totals - A_full @ known_values)[residual_rows]
+        used_cols = A.getnnz(axis=0) > 0
+        A = A[:, used_cols]
+        skus = skus[~known][used_cols].to_numpy()
+        
+        # 通过共同订单相连的SKU才会互相影响，按连通分量分块求解
+        n_components, labels = connected_components(A.T @ A, directed=False)
+        # 行、列所属分量各算一次并排序分组，每个分量直接切片，不再逐个分量扫描整张矩阵
+        col_order = np.argsort(labels, kind='stable')
+        col_splits = np.searchsorted(labels[col_order], np.arange(n_components + 1))
+        row_labels = labels[A.indices[A.indptr[:-1]]]
+        row_order = np.argsort(row_labels, kind='stable')
+        row_splits = np.searchsorted(row_labels[row_order], np.arange(n_components + 1))
+        solved = {}
+        for c in range(n_components):
+            cols = col_order[col_splits[c]:col_splits[c + 1]]
+            rows = row_order[row_splits[c]:row_splits[c + 1]]
+            A_block = A[rows][:, cols]
+            b_block = b[rows]
+            x, fixed = SiteSolver._solve_block(A_block.toarray(), b_block)
+            # 方程组自相矛盾时最小二乘解只是折中值，不能当作确定价
+            if np.any(np.abs(A_block @ x - b_block) > 0.01):
+                continue
+            # 整块取出确定的SKU和价格，一次转成 Python 对象
+            solved.update(zip(skus[cols[fixed]].tolist(), x[fixed].tolist()))
+        return solved
+    
+    @staticmethod
+    def _solve_block(block, b_block):
+        from scipy.linalg import LinAlgError, cho_factor, cho_solve, svd
+        
+        # block 是刚取出的稠密副本，元素都来自整数数量，跳过 LAPACK 前的有限值检查
+        n_rows, n_cols = block.shape
+        if n_rows >= n_cols and n_cols <= 100:
+            # 方程不少于未知数时先解正规方程：Cholesky 成功且主元不过小，说明列满秩，全部SKU唯一确定
+            try:
+                c, low = cho_factor(block.T @ block, check_finite=False)
+            except LinAlgError:
+                c = None
+            if c is not None:
+                pivots = np.abs(np.diag(c))
+                if pivots.min() > 1e-6 * pivots.max():
+                    x = cho_solve((c, low), block.T @ b_block, check_finite=False)
+                    return x, np.ones(n_cols, dtype=bool)
+        
+        # 秩亏时做一次SVD，同时得到最小范数解和零空间；
+        # 方程不少于未知数时 vt 本身就是方阵，只需精简的 u，方程少于未知数时才要完整的 vt 给出零空间
+        u, sv, vt = svd(block, full_matrices=n_rows < n_cols, check_finite=False, overwrite_a=True)
+        rank = int(np.sum(sv > 1e-9 * sv[0]))
+        x = vt[:rank].T @ ((u[:, :rank].T @ b_block) / sv[:rank])
+        # 零空间基向量中分量全为0的列，对应的SKU取值唯一
+        fixed = np.all(np.abs(vt[rank:]) < 1e-9, axis=0)
+        return x, fixed
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _solve_cached(order_rows: tuple, item_rows: tuple, manual_rows: tuple):
+    return SiteSolver._solve_logic(order_rows, item_rows, dict(manual_rows))
 
 try:
     solver = SiteSolver()
@@ -239,9 +373,8 @@ except Exception as e:
     st.stop()
 
 SITES = {'MX': '🇲🇽 墨西哥', 'TH': '🇹🇭 泰国', 'PH': '🇵🇭 菲律宾'}
+HISTORY_PAGE_SIZE = 20
 
-if 'sku_rows' not in st.session_state:
-    st.session_state.sku_rows = [{"sku": "", "qty": 1}]
 if 'delete_confirm' not in st.session_state:
     st.session_state.delete_confirm = {}
 if 'current_site' not in st.session_state:
@@ -252,48 +385,17 @@ if 'success_message' not in st.session_state:
     st.session_state.success_message = None
 if 'order_id_input' not in st.session_state:
     st.session_state.order_id_input = ""
+if 'history_limit' not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
 
-def add_row():
-    st.session_state.sku_rows.append({"sku": "", "qty": 1})
-
-def remove_row(index):
-    if len(st.session_state.sku_rows) > 1:
-        st.session_state.sku_rows.pop(index)
-        st.rerun()
+# 商品明细表的初始内容，每次传入同一份数据，编辑结果由 data_editor 自己保存在 session_state
+EMPTY_ITEMS = pd.DataFrame({"sku": [""], "qty": [1]})
 
-st.markdown("""
-<style>
-    .block-container {padding-top: 2rem !important;}
-    .conflict-box {background-color: #f8d7da; border: 2px solid #dc3545; padding: 15px; margin: 10px 0; border-radius: 8px;}
-</style>
-""", unsafe_allow_html=True)
-
-st.title("📦 SKU 藏价求解器")
-
-if st.session_state.force_refresh:
-    st.session_state.force_refresh = False
-    st.rerun()
-
-if st.session_state.success_message:
-    st.success(st.session_state.success_message)
-    st.session_state.success_message = None
-
-cols = st.columns(3)
-for i, (key, label) in enumerate(SITES.items()):
-    with cols[i]:
-        btn_type = "primary" if st.session_state.current_site == key else "secondary"
-        if st.button(label, key=f"site_{key}", type=btn_type, use_container_width=True):
-            st.session_state.current_site = key
-            st.rerun()
-
-site = st.session_state.current_site
-st.markdown(f"<h3 style='text-align: center;'>当前站点: {SITES[site]}</h3>", unsafe_allow_html=True)
-
-left, right = st.columns([4, 6])
-
-with left:
-    st.subheader("📝 录入新订单")
-    with st.container(border=True):
+# 录入区是独立的 fragment：提交未通过校验时只重跑这一块，不重新读取数据、求解和渲染右侧结果
+@st.fragment
+def order_entry_panel(site):
+    # 放进表单：输入过程中不触发整页重跑，只有点击表单内按钮才提交
+    with st.form("new_order", border=True, enter_to_submit=False):
         # 订单编号：无默认值，需手动输入
         order_id = st.text_input(
             "订单编号", 
@@ -302,38 +404,25 @@ with left:
             key="order_id_field"
         )
         
-        items = []
-        for i, row in enumerate(st.session_state.sku_rows):
-            c1, c2, c3 = st.columns([3, 2, 1])
-            with c1:
-                sku = st.text_input(
-                    f"产品编码_{i}", 
-                    value=row["sku"], 
-                    key=f"sku_{i}", 
-                    placeholder="如: SKU001",
-                    label_visibility="collapsed"
-                )
-            with c2:
-                # 注意：Streamlit number_input 必须有默认值，这里保持1但视觉上提示用户检查
-                qty = st.number_input(
-                    f"数量_{i}", 
-                    min_value=1, 
-                    value=1, 
-                    step=1,
-                    key=f"qty_{i}", 
-                    label_visibility="collapsed"
-                )
-            with c3:
-                if len(st.session_state.sku_rows) > 1:
-                    if st.button("✕", key=f"del_{i}"):
-                        remove_row(i)
-            
-            if sku.strip():
-                items.append({"sku": sku.strip().upper(), "qty": qty})
+        # 商品明细用一个可增删行的表格录入，代替每行一组输入框和删除按钮
+        edited = st.data_editor(
+            EMPTY_ITEMS,
+            key="items_editor",
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "sku": st.column_config.TextColumn("产品编码", help="如: SKU001"),
+                # 新增行数量默认1，提交前请检查
+                "qty": st.column_config.NumberColumn("数量", min_value=1, step=1, default=1, required=True)
+            }
+        )
         
-        if st.button("➕ 添加商品行", use_container_width=True):
-            add_row()
-            st.rerun()
+        items = []
+        for sku, qty in zip(edited["sku"], edited["qty"]):
+            sku = sku.strip().upper() if isinstance(sku, str) else ""
+            if sku:
+                items.append({"sku": sku, "qty": int(qty) if pd.notna(qty) else 1})
         
         # 订单总藏价：默认0，必须手动修改
         total = st.number_input(
@@ -342,10 +431,11 @@ with left:
             value=0.0,
             step=10.0, 
             format="%.2f",
-            placeholder="0.00"
+            placeholder="0.00",
+            key="total_field"
         )
         
-        if st.button("🚀 提交订单", type="primary", use_container_width=True):
+        if st.form_submit_button("🚀 提交订单", type="primary", use_container_width=True):
             if not order_id.strip(): 
                 st.error("请输入订单编号")
             elif not items: 
@@ -357,7 +447,10 @@ with left:
                     success, msg = solver.db.add_order(site, order_id.strip(), total, items)
                     if success:
                         st.session_state.success_message = "订单已保存"
-                        st.session_state.sku_rows = [{"sku": "", "qty": 1}]
+                        # 保存成功才清空表单（校验失败时要保留输入，不能用 clear_on_submit）；
+                        # 带 key 的控件只认 session_state 中的值，需删除后才会回到默认值
+                        for k in ("order_id_field", "total_field", "items_editor"):
+                            st.session_state.pop(k, None)
                         st.session_state.order_id_input = ""
                         st.rerun()
                     else:
@@ -365,13 +458,47 @@ with left:
                 except Exception as e:
                     st.error(f"保存失败: {e}")
 
+st.markdown("""
+<style>
+    .block-container {padding-top: 2rem !important;}
+    .conflict-box {background-color: #f8d7da; border: 2px solid #dc3545; padding: 15px; margin: 10px 0; border-radius: 8px;}
+</style>
+""", unsafe_allow_html=True)
+
+st.title("📦 SKU 藏价求解器")
+
+if st.session_state.force_refresh:
+    st.session_state.force_refresh = False
+    st.rerun()
+
+if st.session_state.success_message:
+    st.success(st.session_state.success_message)
+    st.session_state.success_message = None
+
+cols = st.columns(3)
+for i, (key, label) in enumerate(SITES.items()):
+    with cols[i]:
+        btn_type = "primary" if st.session_state.current_site == key else "secondary"
+        if st.button(label, key=f"site_{key}", type=btn_type, use_container_width=True):
+            st.session_state.current_site = key
+            st.session_state.history_limit = HISTORY_PAGE_SIZE
+            st.rerun()
+
+site = st.session_state.current_site
+st.markdown(f"<h3 style='text-align: center;'>当前站点: {SITES[site]}</h3>", unsafe_allow_html=True)
+
+left, right = st.columns([4, 6])
+
+with left:
+    st.subheader("📝 录入新订单")
+    order_entry_panel(site)
+
 with right:
-    # 确保接收6个返回值，使用 _ 忽略最后一个（inconsistent_orders）
     try:
-        determined, conflicts, constraints, underdetermined, orders, _ = solver.solve(site)
+        determined, conflicts, constraints, underdetermined, orders, inconsistent_orders = solver.solve(site)
     except Exception as e:
         st.error(f"计算失败: {e}")
-        determined, conflicts, constraints, underdetermined, orders = {}, {}, [], [], []
+        determined, conflicts, constraints, underdetermined, orders, inconsistent_orders = {}, {}, [], [], [], []
     
     c1, c2, c3 = st.columns(3)
     c1.metric("已确定SKU", len(determined))
@@ -430,19 +557,43 @@ with right:
                     except Exception as e:
                         st.error(f"清除失败: {e}")
     
+    if inconsistent_orders:
+        st.markdown("---")
+        st.warning("⚠️ 以下订单与已有订单商品组合相同但总藏价不同，已忽略，请核对")
+        for inc in inconsistent_orders:
+            st.markdown(
+                f"**订单 {inc['order_id']}**: {inc['equation']} = {inc['total']:.2f}"
+                f"（订单 {inc['same_as']} 为 {inc['same_as_total']:.2f}）"
+            )
+    
     if determined and not conflicts:
         st.markdown("---")
         st.subheader("✅ 已确定藏价")
-        data = [{"SKU": k, "藏价": f"{v:.2f}"} for k, v in determined.items()]
-        st.dataframe(pd.DataFrame(data), use_container_width=True, hide_index=True)
+        # 按列整体构造，价格保持数值类型（表格内按价格排序也正确），显示格式交给 column_config
+        data = pd.DataFrame({
+            "SKU": list(determined.keys()),
+            "藏价": np.round(np.fromiter(determined.values(), dtype=np.float64, count=len(determined)), 2)
+        })
+        st.dataframe(
+            data,
+            use_container_width=True,
+            hide_index=True,
+            column_config={"藏价": st.column_config.NumberColumn(format="%.2f")}
+        )
     
     if constraints:
         st.markdown("---")
         st.subheader("🔗 欠定约束（需更多数据）")
-        for cons in constraints:
-            with st.container(border=True):
-                st.markdown(f"**订单 {cons['order_id']}**: {cons['equation']}")
-                st.caption(f"涉及待定SKU: {', '.join(cons['missing_skus'])}")
+        # 整张表一次渲染，不再为每条约束创建一组容器控件
+        st.dataframe(
+            pd.DataFrame({
+                "订单": [cons['order_id'] for cons in constraints],
+                "约束方程": [cons['equation'] for cons in constraints],
+                "涉及待定SKU": [", ".join(cons['missing_skus']) for cons in constraints]
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
     
     if not determined and not conflicts and not constraints and orders:
         st.info("数据不足以确定藏价，请继续录入订单")
@@ -459,10 +610,20 @@ with right:
         except:
             items_data = []
         
-        for order in orders:
+        # 一次分组拼好每个订单的商品描述，避免每个订单都扫描全部明细
+        items_map = {}
+        if items_data:
+            items_df = pd.DataFrame(items_data)
+            items_map = (
+                items_df.assign(label=items_df['sku'] + "×" + items_df['quantity'].astype(str))
+                .groupby('order_id')['label'].agg(", ".join)
+                .to_dict()
+            )
+        
+        # 订单已按时间倒序，只渲染最近的一页，避免每次重跑都创建全部历史行的控件
+        for order in orders[:st.session_state.history_limit]:
             oid = order['order_id']
-            o_items = [it for it in items_data if it['order_id'] == oid]
-            items_str = ", ".join([f"{it['sku']}×{it['quantity']}" for it in o_items])
+            items_str = items_map.get(oid, "")
             
             with st.container(border=True):
                 col1, col2, col3, col4 = st.columns([2, 3, 2, 1])
@@ -495,3 +656,9 @@ with right:
                         if st.button("✕", key=f"no_{oid}"):
                             st.session_state.delete_confirm[ckey] = False
                             st.rerun()
+        
+        if len(orders) > st.session_state.history_limit:
+            hidden_count = len(orders) - st.session_state.history_limit
+            if st.button(f"加载更多（还有 {hidden_count} 条）", use_container_width=True):
+                st.session_state.history_limit += HISTORY_PAGE_SIZE
+                st.rerun()
@@ -0,0 +1,55 @@
+-- Supabase 索引与函数，在 SQL Editor 中执行（可重复执行）
+
+-- 所有读取都按站点过滤，删除订单按 (site, order_id) 定位；
+-- 唯一索引同时负责订单号判重（插入冲突返回 23505）
+DROP INDEX IF EXISTS orders_site_order_id_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS orders_site_order_id_key ON orders (site, order_id);
+-- 历史订单按录入时间倒序读取，走索引顺序扫描，免去排序
+CREATE INDEX IF NOT EXISTS orders_site_created_at_idx ON orders (site, created_at DESC);
+CREATE INDEX IF NOT EXISTS order_items_site_order_id_idx ON order_items (site, order_id);
+CREATE INDEX IF NOT EXISTS manual_prices_site_idx ON manual_prices (site);
+
+-- 一次取回站点的全部数据，替代分别查询三张表的三次请求；
+-- 只返回应用用到的列（site 已知，不必每行重复）
+CREATE OR REPLACE FUNCTION get_site_bundle(p_site text)
+RETURNS json
+LANGUAGE sql STABLE
+AS $$
+  SELECT json_build_object(
+    'orders', (SELECT coalesce(json_agg(o ORDER BY o.created_at DESC), '[]'::json)
+               FROM (SELECT order_id, total_hidden_price, created_at FROM orders WHERE site = p_site) o),
+    'items', (SELECT coalesce(json_agg(i), '[]'::json)
+              FROM (SELECT order_id, sku, quantity FROM order_items WHERE site = p_site) i),
+    'manual', (SELECT coalesce(json_agg(m), '[]'::json)
+               FROM (SELECT sku, manual_price FROM manual_prices WHERE site = p_site) m)
+  );
+$$;
+
+-- 新增订单：订单和明细在同一事务内写入，一次请求完成；
+-- 订单号已存在时（ON CONFLICT）不写入任何数据，返回 false
+CREATE OR REPLACE FUNCTION add_site_order(p_site text, p_order_id text, p_total numeric, p_items json, p_created_at timestamptz)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO orders (site, order_id, total_hidden_price, created_at)
+  VALUES (p_site, p_order_id, p_total, p_created_at)
+  ON CONFLICT (site, order_id) DO NOTHING;
+  IF NOT FOUND THEN
+    RETURN false;
+  END IF;
+  INSERT INTO order_items (site, order_id, sku, quantity)
+  SELECT p_site, p_order_id, i.sku, i.quantity
+  FROM json_to_recordset(p_items) AS i(sku text, quantity int);
+  RETURN true;
+END;
+$$;
+
+-- 删除订单：明细和订单在同一事务内删除，一次请求完成
+CREATE OR REPLACE FUNCTION delete_site_order(p_site text, p_order_id text)
+RETURNS void
+LANGUAGE sql
+AS $$
+  DELETE FROM order_items WHERE site = p_site AND order_id = p_order_id;
+  DELETE FROM orders WHERE site = p_site AND order_id = p_order_id;
+$$;